@@ -1,19 +1,25 @@
-import json
+import asyncio
+import hashlib
+import logging
+import sys
 import threading
 import time
 import uuid
 
+import orjson
 import uvicorn
-from starlette.responses import StreamingResponse, Response, HTMLResponse, RedirectResponse
+from starlette.responses import StreamingResponse, Response, HTMLResponse, JSONResponse
 from starlette.staticfiles import StaticFiles
 
 from web.chaoxingWorker import Multitasking
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Header
 from fastapi.middleware.cors import CORSMiddleware
 
 from web.utils import chaoxing_web_prompt
 
+logger = logging.getLogger("Web")
+
 app = FastAPI()
 # 添加CORS中间件
 app.add_middleware(
@@ -38,6 +44,10 @@ async def preflight_handler(rest_of_path: str):
 
 multitasking = Multitasking()
 
+SSE_KEEPALIVE_INTERVAL = 15  # 通信流心跳间隔(秒)
+SSE_BATCH_WINDOW = 0.05  # 通信流合并输出的时间窗口(秒)
+SSE_KEEPALIVE_FRAME = b": keepalive\n\n"  # 心跳帧, 内容固定, 预先编码
+
 
 # 创建新的工作线程
 def create_process():
@@ -46,34 +56,41 @@ def create_process():
     return process_id
 
 
-def comm_stream_generator(process_id):
+async def comm_stream_generator(process, last_seq=0):
     """
-    通信流生成器
+    通信流生成器, 有新输出时立即推送增量部分, 空闲时定期发送心跳
     Args:
-        process_id:
+        process: 目标进程, 连接时解析一次, 之后不再查询任务表
+        last_seq: 客户端已接收的最新输出片段序号
 
     Returns:
 
     """
-    while True:
-        try:
-            output_new = multitasking.get_process(process_id).console.get_update_output()
+    console = process.console
+    try:
+        while process.alive:
+            last_seq, output_new = console.get_update_output(last_seq)
 
-            update = False  # 是否有更新
             if output_new != "":
-                update = True
-
-            data = str(json.dumps({"update": update, "output": output_new}))
-            yield f"data: {data}\n\n"  # 将数据序列化为JSON，然后编码为字节流
-            time.sleep(2)
-        except (ConnectionResetError, BrokenPipeError):
-            # 客户端断开连接，停止生成事件
-            print("Client disconnected")
+                data = orjson.dumps({"update": True, "output": output_new})
+                # 携带片段序号作为事件id, 断线重连时浏览器会通过 Last-Event-ID 回传
+                yield b"id: %d\ndata: %b\n\n" % (last_seq, data)  # 将数据序列化为JSON，然后编码为字节流
+
+            # 等待新的输出并合并时间窗口内的连续输出, 超时则发送心跳防止代理断开连接
+            if not await console.wait_output(last_seq, SSE_KEEPALIVE_INTERVAL, SSE_BATCH_WINDOW):
+                yield SSE_KEEPALIVE_FRAME
+    except (ConnectionResetError, BrokenPipeError):
+        # 客户端断开连接，停止生成事件
+        logger.info("Client disconnected process_id=%s", process.process_id)
+    except asyncio.CancelledError:
+        # 客户端断开时 Starlette 会取消正在等待输出的生成器, 记录后继续抛出以完成取消
+        logger.info("Client cancelled process_id=%s", process.process_id)
+        raise
 
 
 # 获取工作线程的ID
 @app.get("/get_process_id")
-def get_process_id(phone: str):
+async def get_process_id(phone: str):
     """
     获取工作线程的ID
     Args:
@@ -84,19 +101,19 @@ def get_process_id(phone: str):
     """
     process_id = multitasking.get_process_id(phone)
     if process_id is None:
-        print("没找到这个手机号的进程ID", phone)
+        logger.debug("没找到这个手机号的进程ID %s", phone)
         process_id = create_process()
 
-    for i in multitasking.tasks:
-        print(i.process_id, i.phone)
-    print('分配工作线程id', process_id)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("当前进程 %s", [(task.process_id, task.phone) for task in multitasking.tasks.values()])
+    logger.debug("分配工作线程id %s", process_id)
 
     return {"status": "success", "process_id": process_id}
 
 
 # 获取工作线程的历史输出
 @app.get("/get_process_output")
-def get_process_output(process_id: str):
+async def get_process_output(process_id: str):
     """
     获取进程的输出
     Args:
@@ -105,27 +122,40 @@ def get_process_output(process_id: str):
     Returns:
 
     """
-    output = multitasking.get_process(process_id).console.get_output()
-    return {"status": "success", "output": output}
+    # 同时返回最新片段序号, 用于连接通信流时只接收之后的增量输出; 以及输出缓存长度, 页面按此保留输出片段
+    console = multitasking.get_process(process_id).console
+    seq, output = console.get_update_output()
+    return {"status": "success", "output": output, "seq": seq, "maxlen": console.output_collector.maxlen}
 
 
 # 连接通信流
 @app.get("/comm_stream")
-def comm_stream(process_id: str):
+async def comm_stream(process_id: str, since: int = 0, last_event_id: str | None = Header(default=None)):
     """
     连接通信流
     Args:
         process_id:
+        since: 客户端已接收的最新输出片段序号
+        last_event_id: 断线重连时浏览器回传的最新事件id, 优先于 since
 
     Returns:
 
     """
-    return StreamingResponse(comm_stream_generator(process_id), media_type="text/event-stream")
+    process = multitasking.get_process(process_id)
+    if process is None:
+        # 返回 404 而不是 200, 让 EventSource 触发 onerror 而不是把错误信息当作事件流解析
+        return JSONResponse(
+            status_code=404,
+            content={"status": "error", "message": "No process found with id {}".format(process_id)},
+        )
+    if last_event_id is not None and last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(comm_stream_generator(process, since), media_type="text/event-stream")
 
 
 # 更新进程的最后刷新的时间
 @app.get("/update_process_refresh_time")
-def update_process_refresh_time(process_id: str):
+async def update_process_refresh_time(process_id: str):
     """
     更新进程的最后刷新的时间
     Args:
@@ -138,12 +168,12 @@ def update_process_refresh_time(process_id: str):
     process = multitasking.get_process(process_id)
     if process is None:
         return {"status": "error", "message": "No process found with id {}".format(process_id)}
-    process.last_refresh_time = time.time()
+    process.last_refresh_time = time.monotonic()
     return {"status": "success"}
 
 
 @app.get("/send_value")
-def send_value(process_id: str, value: str):
+async def send_value(process_id: str, value: str):
     """
     发送值
     Args:
@@ -153,32 +183,40 @@ def send_value(process_id: str, value: str):
     Returns:
 
     """
-    # 如果进程ID在输入队列中, 则更新值
-    if process_id in list(chaoxing_web_prompt.input_queue.keys()):
-        chaoxing_web_prompt.input_queue[process_id] = value
-    print("得到输入", process_id, value)
+    # 输入可能是密码, 日志中不记录具体的值
+    delivered = chaoxing_web_prompt.send(process_id, value)
+    logger.debug("得到输入 process_id=%s delivered=%s", process_id, delivered)
     return {"status": "success"}
 
 
 # 接口正常访问测试
 @app.get("/test")
-def test():
+async def test():
     return {"status": "success"}
 
 
 @app.get("/test2")
-def test2():
+async def test2():
     namelist = []
     for thread in threading.enumerate():
         namelist.append(thread.name)
-        print(thread.name)
     return {"status": "success", "namelist": namelist}
 
 
+# 首页内容在启动时读取一次, 并预先计算 ETag
+with open("web/static/index.html", "rb") as fp:
+    INDEX_BYTES = fp.read()
+INDEX_ETAG = f'"{hashlib.md5(INDEX_BYTES).hexdigest()}"'
+INDEX_HEADERS = {"ETag": INDEX_ETAG, "Cache-Control": "public, max-age=300"}
+
+
 @app.get("/")
 @app.get("/index")
-def read_root():
-    return RedirectResponse(url="/index.html")
+async def read_root(if_none_match: str | None = Header(default=None)):
+    # 浏览器缓存未变化时直接返回 304, 不再传输页面内容
+    if if_none_match == INDEX_ETAG:
+        return Response(status_code=304, headers=INDEX_HEADERS)
+    return Response(content=INDEX_BYTES, media_type="text/html", headers=INDEX_HEADERS)
 
 
 # 静态文件
@@ -186,4 +224,12 @@ app.mount("/", app=StaticFiles(directory="web/static"), name="static")
 
 # 启动uvicorn服务，默认端口8000，main对应文件名
 if __name__ == '__main__':
-    uvicorn.run('app:app', port=2333)
+    # uvloop 不支持 Windows, 该平台下回退到 asyncio 事件循环; 使用 httptools 解析 HTTP 请求
+    # 进程状态 (Multitasking) 保存在内存中, 多个 worker 之间无法共享, 因此只能使用单个 worker
+    uvicorn.run(
+        'app:app',
+        port=2333,
+        loop="asyncio" if sys.platform == "win32" else "uvloop",
+        http="httptools",
+        workers=1,
+    )
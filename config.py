@@ -31,6 +31,7 @@ WORK: dict = conf.get("work", {})
 VIDEO: dict = conf.get("video", {})
 DOCUMENT: dict = conf.get("document", {})
 EXAM: dict = conf.get("exam", {})
+WEB: dict = conf.get("web", {})
 
 # 任务使能配置
 WORK_EN: bool = WORK.get("enable", True)
@@ -42,5 +43,8 @@ WORK_WAIT: int = WORK.get("wait", 15)
 VIDEO_WAIT: int = VIDEO.get("wait", 15)
 DOCUMENT_WAIT: int = DOCUMENT.get("wait", 15)
 
+# Web 服务配置
+WEB_OUTPUT_MAXLEN: int = WEB.get("output_maxlen", 50)
+
 # 搜索器配置
 SEARCHERS: list = conf.get("searchers", [])
@@ -24,7 +24,9 @@ from utils import (
 )
 
 
-prompt_sleep = 1
+# 会话选择输入匹配表达式 (序号+可选的重登标记 r)
+RE_SESSION_INPUT = re.compile(r"^(\d+)(r?)")
+
 
 def logo(tui_ctx: Console) -> None:
     "显示项目logo"
@@ -69,14 +71,9 @@ def login(process, tui_ctx: Console, api: ChaoXingAPI):
         if not process.alive:
             process.exit()
 
-        while True:
-            # print(process.process_id, "等待输入")
-            uname = chaoxing_web_prompt.ask(
-                "[yellow]请输入手机号, 留空为二维码登录[/]",
-                console=tui_ctx)
-            if uname is not None:
-                break
-            time.sleep(prompt_sleep)
+        uname = chaoxing_web_prompt.ask(
+            "[yellow]请输入手机号, 留空为二维码登录[/]",
+            console=tui_ctx)
 
         # uname = Prompt.ask("[yellow]请输入手机号, 留空为二维码登录[/]", console=tui_ctx)
 
@@ -115,14 +112,9 @@ def login(process, tui_ctx: Console, api: ChaoXingAPI):
         # 手机号+密码登录
         else:
 
-            while True:
-                # print(process.process_id, "等待输入")
-                passwd = chaoxing_web_prompt.ask(
-                    "[yellow]请输入密码 (内容隐藏)",
-                    console=tui_ctx)
-                if passwd is not None:
-                    break
-                time.sleep(prompt_sleep)
+            passwd = chaoxing_web_prompt.ask(
+                "[yellow]请输入密码 (内容隐藏)",
+                console=tui_ctx)
 
             # passwd = Prompt.ask("[yellow]请输入密码 (内容隐藏)", password=True, console=tui_ctx)
 
@@ -183,14 +175,9 @@ def select_session(process, tui_ctx: Console, sessions: list[SessionModule], api
         # inp = Prompt.ask("输入会话序号选择 ([yellow]序号后加r重登[/]), 留空登录新账号, 退出输入 [yellow]q[/]",
         #                  console=tui_ctx)
 
-        while True:
-            # print(process.process_id, "等待输入")
-            inp = chaoxing_web_prompt.ask(
-                "输入会话序号选择 ([yellow]序号后加r重登[/]), 留空登录新账号, 退出输入 [yellow]q[/]",
-                console=tui_ctx)
-            if inp is not None:
-                break
-            time.sleep(prompt_sleep)
+        inp = chaoxing_web_prompt.ask(
+            "输入会话序号选择 ([yellow]序号后加r重登[/]), 留空登录新账号, 退出输入 [yellow]q[/]",
+            console=tui_ctx)
 
         tui_ctx.print('')
         if inp == "":
@@ -199,7 +186,7 @@ def select_session(process, tui_ctx: Console, sessions: list[SessionModule], api
                 return
         elif inp == "q":
             sys.exit()
-        elif r := re.match(r"^(\d+)(r?)", inp):
+        elif r := RE_SESSION_INPUT.match(inp):
             index = int(r.group(1))
             if r.group(2) == "r":  # 重登逻辑
                 starts = relogin(tui_ctx, sessions[index], api)
@@ -245,14 +232,9 @@ def select_class(process, tui_ctx: Console, classes: ClassContainer) -> str:
         #     "请输入欲完成的课程 ([yellow]序号/名称/id[/]), 序号前加[yellow]\"EXAM|\"[/]进入考试模式, 输入 [yellow]q[/] 退出",
         #     console=tui_ctx)
 
-        while True:
-            # print(process.process_id, "等待输入")
-            command = chaoxing_web_prompt.ask(
-                "请输入欲完成的课程 ([yellow]序号/名称/id[/]), 序号前加[yellow]\"EXAM|\"[/]进入考试模式, 输入 [yellow]q[/] 退出",
-                console=tui_ctx)
-            if command is not None:
-                break
-            time.sleep(prompt_sleep)
+        command = chaoxing_web_prompt.ask(
+            "请输入欲完成的课程 ([yellow]序号/名称/id[/]), 序号前加[yellow]\"EXAM|\"[/]进入考试模式, 输入 [yellow]q[/] 退出",
+            console=tui_ctx)
 
         tui_ctx.print("")
         if command == "q":
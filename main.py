@@ -182,15 +182,17 @@ def fuck_task_worker(chap: ChapterContainer):
                         logger.error("\n-----*未开放章节, 程序异常退出*-----")
                         sys.exit()
                 refresh_flag = True
+                executed = False  # 是否执行了任务点, 未执行时任务点状态不会变化
                 try:
                     # 开始分类讨论任务点类型
                     # 章节测验类型
                     if isinstance(task_point, PointWorkDto) and (
                         config.WORK_EN or config.WORK["export"] is True
                     ):
+                        # 解析任务点卡片, 导出与完成共用解析结果
+                        need_todo = task_point.parse_attachment()
                         # 导出作业试题
                         if config.WORK["export"] is True:
-                            task_point.parse_attachment()
                             # 保存 json 文件
                             task_point.export(
                                 config.EXPORT_PATH / f"work_{task_point.work_id}.json"
@@ -198,7 +200,7 @@ def fuck_task_worker(chap: ChapterContainer):
 
                         # 完成章节测验
                         if config.WORK_EN:
-                            if not task_point.parse_attachment():
+                            if not need_todo:
                                 continue
                             task_point.fetch_all()
                             # 实例化解决器
@@ -210,6 +212,7 @@ def fuck_task_worker(chap: ChapterContainer):
                             # 传递 TUI ctx
                             lay_left.update(resolver)
                             # 开始执行自动接管
+                            executed = True
                             resolver.execute()
                             # 开始等待
                             task_wait(lay_left, config.WORK_WAIT, f"试题《{task_point.title}》已结束")
@@ -230,6 +233,7 @@ def fuck_task_worker(chap: ChapterContainer):
                         # 传递 TUI ctx
                         lay_left.update(resolver)
                         # 开始执行自动接管
+                        executed = True
                         resolver.execute()
                         # 开始等待
                         task_wait(lay_left, config.VIDEO_WAIT, f"视频《{task_point.title}》已结束")
@@ -243,6 +247,7 @@ def fuck_task_worker(chap: ChapterContainer):
                         # 传递 TUI ctx
                         lay_left.update(resolver)
                         # 开始执行自动接管
+                        executed = True
                         resolver.execute()
 
                         # 开始等待
@@ -251,9 +256,10 @@ def fuck_task_worker(chap: ChapterContainer):
                 except (TaskPointError, NotImplementedError) as e:
                     logger.error(f"任务点自动接管执行异常 -> {e.__class__.__name__} {e.__str__()}")
 
-                # 刷新章节任务点状态
-                chap.fetch_point_status()
-                _show_chapter(index)
+                # 执行过任务点才刷新章节任务点状态
+                if executed:
+                    chap.fetch_point_status()
+                    _show_chapter(index)
 
         lay_left.unsplit()
         lay_left.update(
@@ -118,6 +118,10 @@ def mask_phone(phone: str) -> str:
     return phone[:3] + "****" + phone[-4:]
 
 
+# 人脸图片文件名匹配表达式
+RE_FACE_FILENAME = re.compile(r'\d+(_\d+)?')
+
+
 def get_face_path_by_puid(puid: int) -> Path | None:
     """获取并随机选择该 puid 所属的人脸图片路径
     Args:
@@ -127,7 +131,7 @@ def get_face_path_by_puid(puid: int) -> Path | None:
     """
     matched_image = []
     for f in config.FACE_PATH.glob(f'{puid}*.jpg'):
-        if re.match(r'\d+(_\d+)?', f.stem):
+        if RE_FACE_FILENAME.match(f.stem):
             matched_image.append(f)
     if matched_image:
         return random.choice(matched_image)
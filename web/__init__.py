@@ -1 +1,4 @@
+import logging
 
+# Web 服务的日志默认不输出, 需要时由部署方为 "Web" 日志记录器配置处理器
+logging.getLogger("Web").addHandler(logging.NullHandler())
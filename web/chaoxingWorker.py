@@ -1,22 +1,25 @@
 from __future__ import annotations
 
+import asyncio
 import json
+import logging
+import os
+import queue
 import sys
 import threading
 import time
-import re
 from collections import deque
 from enum import Enum
 from os import PathLike
 from typing import Literal, Optional, Union, List, Any, TextIO
 
-from bs4 import BeautifulSoup
 from rich.align import Align
 from rich.console import Console
 from rich.layout import Layout
 from rich.live import Live
 from rich.panel import Panel
 from rich.prompt import Prompt
+from rich.segment import ControlType, Segment
 from rich.style import Style
 from rich.text import TextType
 from rich.traceback import install
@@ -38,86 +41,159 @@ from resolver import DocumetResolver, MediaPlayResolver, QuestionResolver
 from utils import __version__, ck2dict, sessions_load
 from web.utils import ChaoxingProcessState, check_timeout
 
+HTML_CODE_FORMAT = '<code style="font-family:inherit">{code}</code>'  # 导出的输出片段格式
+HTML_CODE_EMPTY = HTML_CODE_FORMAT.format(code="")  # 没有可见内容时导出的片段
+WEB_CONSOLE_FILE = open(os.devnull, "w", encoding="utf8")  # web模式下所有控制台共用的空设备
+# 将光标移到行首或其他行的控制码, 如 Live 刷新画面前的定位, 导出时替换为换行以分隔前后的画面
+CONTROL_LINE_BREAK = {
+    ControlType.CARRIAGE_RETURN,
+    ControlType.HOME,
+    ControlType.CURSOR_UP,
+    ControlType.CURSOR_DOWN,
+    ControlType.CURSOR_MOVE_TO,
+}
 
-class ChaoxingWebConsole(Console):
-    last_output = ""  # 记录上次的输出，用于判断是否有更新
+logger = logging.getLogger("Web")
+
+
+class ConsoleRenderer(threading.Thread):
+    """
+    控制台渲染线程
+
+    web模式下的 print 在调用线程中渲染并记录输出, 由该线程统一导出 html, 工作线程无需等待导出完成;
+    短时间内的多次 print 会合并为一次导出
+    """
+
+    def __init__(self, batch_window=0.02):
+        super().__init__(name="ConsoleRenderer", daemon=True)
+        self.batch_window = batch_window  # 合并打印的时间窗口(秒)
+        self.queue = queue.Queue()  # 有待导出输出的控制台
+
+    def submit(self, console):
+        self.queue.put(console)
+
+    def run(self):
+        while True:
+            consoles = [self.queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while (remaining := deadline - time.monotonic()) > 0:
+                try:
+                    consoles.append(self.queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            for console in dict.fromkeys(consoles):  # 去重并保持顺序
+                try:
+                    console.collect_output()
+                except Exception:
+                    # 渲染线程中的异常无法抛给调用方, 记录到该进程的日志中
+                    console.process.logger.error("控制台输出导出失败", exc_info=True)
 
+
+console_renderer = ConsoleRenderer()
+console_renderer.start()
+
+
+class ChaoxingWebConsole(Console):
     def __init__(self, process, web_mode=False, height: int = 30):
         self.process = process
         self.mode = web_mode
 
-        super().__init__(height=height, record=True)
-        self.output_collector = deque(maxlen=50)
+        if web_mode:
+            # web模式只记录输出, 写入空设备而不在控制台打印; 强制终端模式以保留 Live 的实时刷新
+            super().__init__(
+                height=height,
+                record=True,
+                file=WEB_CONSOLE_FILE,
+                force_terminal=True,
+            )
+        else:
+            super().__init__(height=height, record=True)
+        self.output_collector = deque(maxlen=config.WEB_OUTPUT_MAXLEN)  # 输出片段 (序号, html)
+        self.output_seq = 0  # 最新输出片段的序号, 单调递增
+        self.output_event = asyncio.Event()  # 有新输出时置位, 用于唤醒通信流
+        self.event_loop: asyncio.AbstractEventLoop | None = None  # 通信流所在的事件循环
 
     def print(self, *args, **kwargs):
         # 如果是web模式，记录输出
         if self.mode:
-            # 捕获输出不在控制台打印
-            with self.capture() as capture:
+            # 在调用线程中渲染, 输出为打印时对象的内容, Live 的画面也由渲染钩子在此时生成;
+            # 渲染结果按顺序写入记录缓存, 只将耗时的 html 导出交给渲染线程
+            # Live 在外层 with self 中打印, rich 每次退出缓冲都会记录但只在最外层清空缓冲, 导致画面被记录两次;
+            # 每次打印单独捕获并清空缓冲, 保证只记录一次
+            with self.capture():
                 super().print(*args, **kwargs)
-            self.collect_output()  # 记录输出
+            console_renderer.submit(self)
         else:
             super().print(*args, **kwargs)
 
-    @staticmethod
-    def parse_css(css):
-        css_dict = {}
-        for line in css.split('\n'):
-            if '{' in line and '}' in line:
-                selector, styles = line.split('{')
-                selector = selector.strip()
-                styles = styles.split('}')[0].strip()
-                style_dict = {}
-                for style in styles.split(';'):
-                    if ':' in style:
-                        property, value = style.split(':')
-                        style_dict[property.strip()] = value.strip()
-                css_dict[selector] = style_dict
-
-        return css_dict
-
-    @staticmethod
-    def styles_to_string(styles):
-        return '; '.join(f'{k}: {v}' for k, v in styles.items())
-
     def collect_output(self):
-        html = self.export_html()
-
-        # print(html)
-
-        soup = BeautifulSoup(html, 'html.parser')
-
-        styleMatch = re.search(r'<style>(.*?)</style>', html, re.DOTALL)
-
-        if styleMatch:
-            style_dict = self.parse_css(styleMatch.group(1))
-            for selector, styles in style_dict.items():
-                for item in soup.select(selector):
-                    if 'style' in item.attrs:
-                        item.attrs['style'] += self.styles_to_string(styles)
-                    else:
-                        item.attrs['style'] = self.styles_to_string(styles)
+        # 记录缓存由打印线程写入, 处理控制码和导出需在同一次加锁内完成
+        with self._record_buffer_lock:
+            # rich 合并相邻片段时会把控制码并入普通文本导致其泄漏到 html 中, 导出前先替换或移除控制码片段
+            segments = []
+            for segment in self._record_buffer:
+                if not segment.control:
+                    segments.append(segment)
+                elif any(code[0] in CONTROL_LINE_BREAK for code in segment.control):
+                    segments.append(Segment.line())
+            self._record_buffer[:] = segments
+            # 直接导出内联样式的输出片段, 无需再解析样式表
+            html = self.export_html(inline_styles=True, code_format=HTML_CODE_FORMAT)
+        if html == HTML_CODE_EMPTY:
+            # 只包含控制码的打印 (如 Live 移动光标) 没有可见内容, 不占用输出缓存也不通知通信流
+            return
+        self.output_seq += 1
+        self.output_collector.append((self.output_seq, html))
+        self.notify_output()
 
-        # bodyMatch = re.search(r'<body>(.*?)</body>', html, re.DOTALL)
-        self.output_collector.append(str(soup.body.pre.code))
+    def notify_output(self):
+        """
+        通知通信流有新的输出, 渲染运行在渲染线程中, 需要线程安全地置位事件
+        """
+        if self.event_loop is not None and not self.event_loop.is_closed():
+            self.event_loop.call_soon_threadsafe(self.output_event.set)
 
-    def get_output(self):
-        if not self.mode:  # 如果不是web模式，直接返回
-            return
+    async def wait_output(self, last_seq: int, timeout: float, batch_window: float = 0.0) -> bool:
+        """
+        等待序号 last_seq 之后的新输出
+        Args:
+            last_seq: 调用方已收到的最后一条输出的序号
+            timeout: 超时时间(秒)
+            batch_window: 收到输出后继续等待的时间(秒), 将短时间内的连续输出合并为一次推送
 
-        return "".join(self.output_collector)
+        Returns:
+            是否有新的输出, 超时返回 False
+        """
+        self.event_loop = asyncio.get_running_loop()
+        # 事件由所有连接共享, 只凭序号判断是否已有未读输出, 避免被其他连接清除后漏掉唤醒
+        if self.output_seq <= last_seq:
+            self.output_event.clear()
+            try:
+                await asyncio.wait_for(self.output_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        if batch_window > 0:
+            await asyncio.sleep(batch_window)
+        return True
+
+    def get_update_output(self, last_seq: int = 0) -> tuple[int, str] | None:
+        """
+        获取指定序号之后的增量输出
+        Args:
+            last_seq: 客户端已接收的最新片段序号, 为 0 时返回全部缓存的输出
 
-    def get_update_output(self):
+        Returns:
+            (最新片段序号, 增量输出), 没有更新时增量输出为空字符串
+        """
         if not self.mode:  # 如果不是web模式，直接返回
             return
 
-        output = self.get_output()
-        # 计算更新的部分
-        if self.last_output == output:
-            output = ""
-        self.last_output = output
-
-        return output
+        chunks = list(self.output_collector)  # 取快照, 避免遍历时被工作线程修改
+        if not chunks:
+            return last_seq, ""
+        output = "".join(chunk for seq, chunk in chunks if seq > last_seq)
+        return max(chunks[-1][0], last_seq), output
 
 
 class ChaoxingProcess:
@@ -140,7 +216,7 @@ class ChaoxingProcess:
         self.phone = phone  # 手机号
         self.state = ChaoxingProcessState.INIT  # 进程状态
         self.begian_time = time.time()  # 开始时间
-        self.last_refresh_time = time.time()  # 上次刷新时间
+        self.last_refresh_time = time.monotonic()  # 上次刷新时间, 使用单调时钟不受系统时间调整影响
 
         self.api = ChaoXingAPI()
         self.console = ChaoxingWebConsole(process=self, height=config.TUI_MAX_HEIGHT, web_mode=web_mode)
@@ -282,7 +358,13 @@ class ChaoxingProcess:
         )
 
         chap.fetch_point_status()
-        with Live(self.layout, console=self.console) as live:
+        # web模式下不重定向全局的 stdout/stderr, 否则会把其他进程和服务端的输出写入该控制台
+        with Live(
+            self.layout,
+            console=self.console,
+            redirect_stdout=not self.console.mode,
+            redirect_stderr=not self.console.mode,
+        ) as live:
             # 遍历章节列表
             for index in range(len(chap)):
                 _show_chapter(index)
@@ -318,15 +400,17 @@ class ChaoxingProcess:
                             self.logger.error("\n-----*未开放章节, 程序异常退出*-----")
                             sys.exit()
                     refresh_flag = True
+                    executed = False  # 是否执行了任务点, 未执行时任务点状态不会变化
                     try:
                         # 开始分类讨论任务点类型
                         # 章节测验类型
                         if isinstance(task_point, PointWorkDto) and (
                                 config.WORK_EN or config.WORK["export"] is True
                         ):
+                            # 解析任务点卡片, 导出与完成共用解析结果
+                            need_todo = task_point.parse_attachment()
                             # 导出作业试题
                             if config.WORK["export"] is True:
-                                task_point.parse_attachment()
                                 # 保存 json 文件
                                 task_point.export(
                                     config.EXPORT_PATH / f"work_{task_point.work_id}.json"
@@ -334,7 +418,7 @@ class ChaoxingProcess:
 
                             # 完成章节测验
                             if config.WORK_EN:
-                                if not task_point.parse_attachment():
+                                if not need_todo:
                                     continue
                                 task_point.fetch_all()
                                 # 实例化解决器
@@ -346,6 +430,7 @@ class ChaoxingProcess:
                                 # 传递 TUI ctx
                                 self.lay_left.update(resolver)
                                 # 开始执行自动接管
+                                executed = True
                                 resolver.execute()
                                 # 开始等待
                                 self.task_wait(self.lay_left, config.WORK_WAIT, f"试题《{task_point.title}》已结束")
@@ -366,6 +451,7 @@ class ChaoxingProcess:
                             # 传递 TUI ctx
                             self.lay_left.update(resolver)
                             # 开始执行自动接管
+                            executed = True
                             resolver.execute()
                             # 开始等待
                             self.task_wait(self.lay_left, config.VIDEO_WAIT, f"视频《{task_point.title}》已结束")
@@ -379,6 +465,7 @@ class ChaoxingProcess:
                             # 传递 TUI ctx
                             self.lay_left.update(resolver)
                             # 开始执行自动接管
+                            executed = True
                             resolver.execute()
 
                             # 开始等待
@@ -387,9 +474,10 @@ class ChaoxingProcess:
                     except (TaskPointError, NotImplementedError) as e:
                         self.logger.error(f"任务点自动接管执行异常 -> {e.__class__.__name__} {e.__str__()}")
 
-                    # 刷新章节任务点状态
-                    chap.fetch_point_status()
-                    _show_chapter(index)
+                    # 执行过任务点才刷新章节任务点状态
+                    if executed:
+                        chap.fetch_point_status()
+                        _show_chapter(index)
 
             self.lay_left.unsplit()
             self.lay_left.update(
@@ -407,7 +495,13 @@ class ChaoxingProcess:
             export: 是否开启导出模式, 默认关闭
         """
         self.layout.split_row(self.lay_left, self.lay_right)
-        with Live(self.layout, console=self.console) as live:
+        # web模式下不重定向全局的 stdout/stderr, 否则会把其他进程和服务端的输出写入该控制台
+        with Live(
+            self.layout,
+            console=self.console,
+            redirect_stdout=not self.console.mode,
+            redirect_stderr=not self.console.mode,
+        ) as live:
             # 拉取元数据
             exam.get_meta()
             # 开始考试
@@ -549,18 +643,21 @@ class GarbageCollector(threading.Thread):
 
     def run(self):
         while self.RUNFlAG:
-            for task in self.multitasking.tasks:
-                if check_timeout(task):
-                    print(f"进程 {task.process_id} 已超时，已标记为死亡")
-                    task.alive = False
-                    self.multitasking.tasks.remove(task)  # 从任务列表中移除
-                    # task.exit()
+            # 先标记超时的进程, 再统一移除, 避免遍历时修改任务表
+            dead = [task for task in list(self.multitasking.tasks.values()) if check_timeout(task)]
+            for task in dead:
+                logger.info("进程 %s 已超时，已标记为死亡", task.process_id)
+                task.alive = False
+                self.multitasking.remove_process(task.process_id)  # 从任务列表中移除
+                # task.exit()
             time.sleep(self.check_interval)
 
 
 class Multitasking:
     def __init__(self):
-        self.tasks = []
+        self.tasks: dict[str, ChaoxingProcess] = {}  # 任务表 {process_id: process}
+        self.phone_index: dict[str, str] = {}  # 手机号索引 {phone: process_id}
+        self._lock = threading.Lock()
 
         # 启动垃圾回收线程
         self.gc = GarbageCollector(self)
@@ -572,19 +669,32 @@ class Multitasking:
 
     def create_process(self, process_id):
         process = ChaoxingProcess(process_id=process_id, web_mode=True)
-        self.tasks.append(process)
+        with self._lock:
+            self.tasks[process_id] = process
+            if process.phone is not None:
+                self.phone_index[process.phone] = process_id
         thread = threading.Thread(target=self.threading_fun, args=(process,), name='Thread-' + process_id)
         thread.start()
 
+    def remove_process(self, process_id):
+        with self._lock:
+            process = self.tasks.pop(process_id, None)
+            if process is not None and self.phone_index.get(process.phone) == process_id:
+                del self.phone_index[process.phone]
+
     def get_process(self, process_id):
-        for task in self.tasks:
-            # print(task.process_id, process_id)
-            if task.process_id == process_id:
-                return task
-        return None
+        return self.tasks.get(process_id)
 
     def get_process_id(self, phone):
-        for task in self.tasks:
-            if task.phone == phone:
-                return task.process_id
+        # 手机号在登录后才由工作线程写入, 索引未命中或已失效时回退到遍历并更新索引
+        process_id = self.phone_index.get(phone)
+        process = self.tasks.get(process_id) if process_id is not None else None
+        if process is not None and process.phone == phone:
+            return process_id
+
+        with self._lock:
+            for task in self.tasks.values():
+                if task.phone == phone:
+                    self.phone_index[phone] = task.process_id
+                    return task.process_id
         return None
@@ -1,5 +1,6 @@
-import time
+import threading
 from enum import Enum
+from time import monotonic
 
 from rich.prompt import Prompt
 
@@ -14,43 +15,78 @@ class ChaoxingProcessState(Enum):
     Failed = 3  # 任务失败
 
 
+RUNNING_TIMEOUT = 86400  # 运行中的进程超过86400秒(24小时)没有刷新则超时
+INIT_TIMEOUT = 300  # 不在运行的进程超过300秒(5分钟)没有刷新则超时
+_RUNNING = ChaoxingProcessState.RUNNING
+
+
+def get_remaining_time(process):
+    """
+    获取进程距离超时的剩余时间(秒), last_refresh_time 需使用 time.monotonic 记录
+    Args:
+        process: 目标进程
+
+    Returns:
+
+    """
+    timeout = RUNNING_TIMEOUT if process.state is _RUNNING else INIT_TIMEOUT
+    return timeout - (monotonic() - process.last_refresh_time)
+
+
 def check_timeout(process):
-    if process.state == ChaoxingProcessState.RUNNING:  # 如果进程正在运行
-        if time.time() - process.last_refresh_time > 86400:  # 如果超过86400秒(24小时)没有刷新
-            return True
-    else:  # 如果进程不在运行
-        if time.time() - process.last_refresh_time > 300:  # 如果进程已经开始超过300秒(5分钟)
-            return True
-    return False
+    return get_remaining_time(process) < 0
 
 
 class ChaoxingWebPrompt:
 
     def __init__(self):
         super().__init__()
-        self.input_queue = {}  # 输入队列  {process_id: value}
+        self.input_queue = {}  # 输入队列  {process_id: (event, value_holder)}
+        self.lock = threading.Lock()  # 输入队列由接口线程写入, 工作线程读取
+
+    def send(self, process_id, value):
+        """
+        向等待输入的进程发送值
+        Args:
+            process_id: 目标进程的ID
+            value: 输入的值
+
+        Returns:
+            目标进程是否正在等待输入
+        """
+        with self.lock:
+            waiting = self.input_queue.get(process_id)
+        if waiting is None:
+            return False
+        event, value_holder = waiting
+        value_holder.append(value)
+        event.set()  # 唤醒等待输入的工作线程
+        return True
 
     def ask(self, text, console):
         if console.mode:
-            process_id = console.process.process_id
-
-            # 如果不在输入队列中, 则将其加入输入队列
-            if process_id not in list(self.input_queue.keys()):
-                # 加入输入队列
-                self.input_queue[process_id] = None
-
-                # 这是证明是第一次尝试获取输入，把提示信息输出
-                console.print(text)
-            if self.input_queue[process_id] is not None:
-                return self.input_queue.pop(process_id)
-            else:
-                # web模式下避免卡死，超时后返回一个"timeout"字符串
-                if check_timeout(console.process):
-                    # 更改进程为死亡状态
-                    console.process.alive = False
-                    return "timeout"
-                else:
-                    return None
+            process = console.process
+            event = threading.Event()
+            value_holder = []
+
+            # 加入输入队列, 并把提示信息输出
+            with self.lock:
+                self.input_queue[process.process_id] = (event, value_holder)
+            console.print(text)
+
+            try:
+                # 阻塞等待输入, 前端会定期刷新进程时间, 醒来后重新计算剩余时间
+                while not event.wait(timeout=max(get_remaining_time(process), 0)):
+                    # web模式下避免卡死，超时后返回一个"timeout"字符串
+                    if check_timeout(process):
+                        # 更改进程为死亡状态
+                        process.alive = False
+                        return "timeout"
+            finally:
+                with self.lock:
+                    if self.input_queue.get(process.process_id, (None,))[0] is event:
+                        del self.input_queue[process.process_id]
+            return value_holder[0]
         else:  # 如果不是web模式，正常使用Prompt.ask获取返回值
             return Prompt.ask(text, console=console)
 